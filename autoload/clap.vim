@@ -173,6 +173,11 @@ function! clap#_exit() abort
 
   call map(g:clap.tmps, 'delete(v:val)')
   let g:clap.tmps = []
+
+  " Only if the Python filter has been loaded.
+  if exists('*clap#filter#sync#python#clean_up')
+    call clap#filter#sync#python#clean_up()
+  endif
 endfunction
 
 function! clap#_for(provider_id_or_alias) abort
@@ -42,6 +42,13 @@ function! clap#filter#sync#python#has_dynamic_module() abort
   return s:has_py_dynamic_module
 endfunction
 
+" The pure Python filter keeps the candidates across the keystrokes.
+function! clap#filter#sync#python#clean_up() abort
+  if s:py_fn ==# 'clap_fzy_py'
+    execute s:py_exe 'from clap.fzy import clap_fzy_clean_up; clap_fzy_clean_up()'
+  endif
+endfunction
+
 if s:using_dynamic_module
   " Rust dynamic module has the feature of truncating the long lines to make fuzzy matched items visible.
   function! clap#filter#sync#python#(query, candidates, recent_files, context) abort
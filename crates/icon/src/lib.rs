@@ -29,17 +29,15 @@ pub fn get_icon_or<P: AsRef<Path>>(path: P, default: Icon) -> Icon {
         .file_name()
         .and_then(std::ffi::OsStr::to_str)
         .and_then(|filename| {
-            bsearch_icon_table(filename.to_lowercase().as_str(), EXACTMATCH_ICON_TABLE)
-                .map(|idx| EXACTMATCH_ICON_TABLE[idx].1)
+            EXACTMATCH_ICON_MAP
+                .get(filename.to_lowercase().as_str())
+                .copied()
         })
         .unwrap_or_else(|| {
             path.as_ref()
                 .extension()
                 .and_then(std::ffi::OsStr::to_str)
-                .and_then(|ext| {
-                    bsearch_icon_table(ext, EXTENSION_ICON_TABLE)
-                        .map(|idx| EXTENSION_ICON_TABLE[idx].1)
-                })
+                .and_then(|ext| EXTENSION_ICON_MAP.get(ext).copied())
                 .unwrap_or(default)
         })
 }
@@ -68,9 +66,7 @@ pub fn prepend_filer_icon<P: AsRef<Path>>(path: P, line: &str) -> String {
 
 fn get_tagkind_icon(line: &str) -> Icon {
     pattern::extract_proj_tags_kind(line)
-        .and_then(|kind| {
-            bsearch_icon_table(kind, TAGKIND_ICON_TABLE).map(|idx| TAGKIND_ICON_TABLE[idx].1)
-        })
+        .and_then(|kind| TAGKIND_ICON_MAP.get(kind).copied())
         .unwrap_or(DEFAULT_ICON)
 }
 
@@ -129,8 +125,8 @@ mod tests {
 
     #[test]
     fn test_icon_length() {
-        for table in [EXTENSION_ICON_TABLE, EXACTMATCH_ICON_TABLE].iter() {
-            for (_, i) in table.iter() {
+        for map in [&EXTENSION_ICON_MAP, &EXACTMATCH_ICON_MAP].iter() {
+            for i in map.values() {
                 let icon = format!("{} ", i);
                 assert_eq!(icon.len(), 4);
             }
@@ -140,9 +136,7 @@ mod tests {
     #[test]
     fn test_tagkind_icon() {
         let line = r#"Blines:19                      [implementation@crates/maple_cli/src/cmd/blines.rs] impl Blines {"#;
-        let icon_for = |kind: &str| {
-            bsearch_icon_table(kind, TAGKIND_ICON_TABLE).map(|idx| TAGKIND_ICON_TABLE[idx].1)
-        };
+        let icon_for = |kind: &str| TAGKIND_ICON_MAP.get(kind).copied();
         assert_eq!(icon_for("implementation").unwrap(), get_tagkind_icon(line));
     }
 }
@@ -6,49 +6,90 @@
 #  Whenever you change exactmatch_map.json or extension_map.json,
 #  rerun this script to regenerate src/constants.rs:
 #    ./update_constants.py
+#
+#  Or generate the maps of other json files:
+#    ./update_constants.py --input foo_map.json --var-name FOO_ICON_MAP \
+#        --output src/foo.rs
+import argparse
 import json
 import os
+import sys
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+HEADER = b'''// This file is generated by ../update_constants.py.
+// Do not edit this file manually.
+
+use std::collections::HashMap;
+
+use once_cell::sync::Lazy;
+'''
+
+
+def load_sorted(path):
+    with open(path, 'rb') as f:
+        return sorted(loads(f.read()).items())
+
+
+def iter_map(var_name, items):
+    """
+    Yield the lazy map of the sorted `items` piece by piece, instead of
+    joining the entries into a giant string.
+    """
+    yield (b"\npub static %s: Lazy<HashMap<&'static str, char>> = "
+           b"Lazy::new(|| [" % var_name.encode())
+    for k, v in items:
+        yield b'("%s", \'%s\'),' % (k.encode(), v.encode())
+    yield b'].iter().copied().collect());\n'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Generate the icon maps from the json maps.')
+    parser.add_argument(
+        '--input',
+        nargs='+',
+        default=['extension_map.json', 'exactmatch_map.json',
+                 'tagkind_map.json'],
+        help='json maps of the icons')
+    parser.add_argument(
+        '--var-name',
+        nargs='+',
+        default=['EXTENSION_ICON_MAP', 'EXACTMATCH_ICON_MAP',
+                 'TAGKIND_ICON_MAP'],
+        help='names of the maps, one per input')
+    parser.add_argument('--output',
+                        default='src/constants.rs',
+                        help='rust file to write')
+    parser.add_argument('--debug-sorted',
+                        action='store_true',
+                        help='also write the sorted maps to sorted_<input>')
+    args = parser.parse_args(argv)
+    if len(args.input) != len(args.var_name):
+        parser.error('--input and --var-name must have the same length')
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+
+    with open(args.output, 'wb', buffering=1 << 20) as f:
+        f.write(HEADER)
+        for path, var_name in zip(args.input, args.var_name):
+            items = load_sorted(path)
+            f.writelines(iter_map(var_name, items))
+            if args.debug_sorted:
+                sorted_path = os.path.join(os.path.dirname(path),
+                                           'sorted_' + os.path.basename(path))
+                with open(sorted_path, 'w') as sorted_file:
+                    json.dump(dict(items), sorted_file, indent=2,
+                              ensure_ascii=False)
+
+    os.system('rustfmt ' + args.output)
+
 
-lines = [
-    '// This file is generated by ../update_constants.py.',
-    '// Do not edit this file manually.',
-    '',
-]
-
-with open('extension_map.json', 'r') as f:
-    disordered = json.load(f)
-    sorted_dict = {k: disordered[k] for k in sorted(disordered)}
-
-    joined_tuples = ','.join(
-        map(lambda kv: '("%s", \'%s\')' % (kv[0], kv[1]), sorted_dict.items()))
-    lines.append('pub static EXTENSION_ICON_TABLE: &[(&str, char)] = &[%s];' %
-                 joined_tuples)
-
-with open('exactmatch_map.json', 'r') as f:
-    disordered = json.load(f)
-    sorted_dict = {k: disordered[k] for k in sorted(disordered)}
-
-    joined_tuples = ','.join(
-        map(lambda kv: '("%s", \'%s\')' % (kv[0], kv[1]), sorted_dict.items()))
-    lines.append('pub static EXACTMATCH_ICON_TABLE: &[(&str, char)] = &[%s];' %
-                 joined_tuples)
-
-with open('tagkind_map.json', 'r') as f:
-    disordered = json.load(f)
-    sorted_dict = {k: disordered[k] for k in sorted(disordered)}
-
-    joined_tuples = ','.join(
-        map(lambda kv: '("%s", \'%s\')' % (kv[0], kv[1]), sorted_dict.items()))
-    lines.append('pub static TAGKIND_ICON_TABLE: &[(&str, char)] = &[%s];' %
-                 joined_tuples)
-
-lines.append('''
-pub fn bsearch_icon_table(c: &str, table: &[(&str, char)]) ->Option<usize> {
-    table.binary_search_by(|&(key, _)| key.cmp(&c)).ok()
-}
-  ''')
-
-with open('src/constants.rs', 'w') as f:
-    f.write('\n'.join(lines))
-
-os.system('rustfmt src/constants.rs')
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,8 +1,58 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import heapq
+import os
+from operator import itemgetter
+
 import vim
-from clap.scorer import fzy_scorer, substr_scorer
+from clap.scorer import SCORE_MIN, substr_scorer
+
+#  The Cython extension exists only if built explicitly, prefer it to numba.
+try:
+    from clap.scorer_cy import fzy_scorer
+    fzy_scorer_jit = fzy_score_only_jit = None
+except ImportError:
+    from clap.scorer import fzy_scorer
+    try:
+        from clap.scorer_jit import encode_niddle, fzy_scores, rank_scores
+        from clap.scorer_jit import fzy_score_only as fzy_score_only_jit
+        from clap.scorer_jit import fzy_scorer as fzy_scorer_jit
+    except ImportError:
+        fzy_scorer_jit = fzy_score_only_jit = None
+
+#  Both the Cython and numba scorers work on the UTF-8 bytes of the
+#  candidates.
+NATIVE_FZY_SCORER = (fzy_scorer_jit is not None
+                     or fzy_scorer.__module__ == 'clap.scorer_cy')
+#  The numba kernel scores a whole chunk of candidates without the GIL, so
+#  that the chunks can be scored in parallel once there are enough of them.
+PARALLEL_THRESHOLD = 4096
+#  Only numba scores on the threads, and Python 2 has no os.cpu_count().
+WORKERS = (os.cpu_count() or 1) if fzy_scorer_jit is not None else 1
+
+_executor = None
+
+#  The sort key of the (score, indices, text) results.
+BY_SCORE = itemgetter(0)
+
+#  The query independent data of the candidates prepared by the fzy scorer,
+#  kept across the keystrokes as the candidates of the next keystroke are the
+#  matches of the current one. The data is prepared from the icon offset, so
+#  only the cache of the offset in use is kept, as {offset: {text: data}}.
+_PRECOMP = {}
+#  The most candidates cached, the longer lists are scored without the cache
+#  until the matches narrow down.
+MAX_PRECOMP = 50000
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        #  Not imported on Python 2, which has no concurrent.futures.
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(WORKERS)
+    return _executor
 
 
 def str2bool(v):
@@ -14,53 +64,193 @@ def str2bool(v):
         return v.lower() in ("yes", "true", "t", "1")
 
 
-def apply_score(scorer, query, candidates, enable_icon):
+def apply_score(scorer, query, candidates, offset=0, index_adjust=0,
+                top_k=None, cache=None):
+    """
+    The scorer only matches the candidate from `offset` and returns the
+    positions with `index_adjust` added, so that the icon needs no slicing.
+    """
     scored = []
+    #  The best `top_k` scores so far, the candidates can not beat the worst
+    #  of them are not worth running the DP.
+    top_scores = []
 
     for c in candidates:
-        #  Skip two chars
-        if enable_icon:
-            candidate = c[2:]
+        if top_k and len(top_scores) == top_k:
+            threshold = top_scores[0]
         else:
-            candidate = c
-        score, indices = scorer(query, candidate)
-        if score != float("-inf"):
-            if enable_icon:
-                indices = [x + 4 for x in indices]
-            scored.append({'score': score, 'indices': indices, 'text': c})
+            threshold = SCORE_MIN
+        score, indices = scorer(query, c, threshold, cache, offset,
+                                index_adjust)
+        if score > SCORE_MIN:
+            if top_k:
+                if len(top_scores) < top_k:
+                    heapq.heappush(top_scores, score)
+                else:
+                    heapq.heappushpop(top_scores, score)
+            scored.append((score, indices, c))
 
     return scored
 
 
-def fuzzy_match_py(query, candidates, enable_icon):
+def rank_jit(niddle, candidates, offset, top_k):
+    """
+    Rank the candidates by the scores of clap.scorer_jit.fzy_scores, in
+    chunks on the threads if there are enough of them.
+
+    Return the `top_k` best matches and the rest matched candidates, or None
+    if fzy_scores can not take the candidates.
+    """
+    def score_chunk(chunk):
+        #  The k-th best score of a chunk is never above the global one, so
+        #  pruning by the threshold of the chunk is still safe.
+        return fzy_scores(niddle, chunk, offset, top_k)
+
+    if WORKERS > 1 and len(candidates) > PARALLEL_THRESHOLD:
+        size = -(-len(candidates) // WORKERS)
+        chunks = [
+            candidates[i:i + size] for i in range(0, len(candidates), size)
+        ]
+        scores = list(get_executor().map(score_chunk, chunks))
+    else:
+        scores = [score_chunk(candidates)]
+    if any(s is None for s in scores):
+        return None
+
+    ranked, rest = rank_scores(scores, top_k)
+    return ([candidates[i] for i in ranked], [candidates[i] for i in rest])
+
+
+def get_precomp(offset, size):
+    """
+    Return the cache of the candidates prepared from `offset`, the caches of
+    the other offsets are dropped.
+
+    Return None if `size` candidates are too many to cache.
+    """
+    global _PRECOMP
+    if size > MAX_PRECOMP:
+        _PRECOMP = {}
+        return None
+    if offset not in _PRECOMP:
+        _PRECOMP = {offset: {}}
+    return _PRECOMP[offset]
+
+
+def keep_precomp(offset, filtered):
+    """
+    Drop the cached candidates that can not be the candidates of the next
+    keystroke, once they outnumber the matched ones or MAX_PRECOMP.
+    """
+    cache = _PRECOMP[offset]
+    if len(cache) <= min(2 * len(filtered), MAX_PRECOMP):
+        return
+    precomp = {}
+    for c in filtered:
+        prepared = cache.get(c)
+        if prepared is not None:
+            precomp[c] = prepared
+    _PRECOMP[offset] = precomp
+
+
+def fuzzy_match_py(query, candidates, enable_icon, top_k=None):
+    """
+    If `top_k` is given, only the first `top_k` results are ranked and have
+    the matched indices, the rest matched candidates are appended in the
+    original order.
+    """
+    niddle = query
     if ' ' in query:
         scorer = substr_scorer
+    elif fzy_scorer_jit is not None:
+        #  Only the top_k results need the positions, which are computed for
+        #  them afterwards.
+        if top_k is None:
+            scorer = fzy_scorer_jit
+        else:
+            scorer = fzy_score_only_jit
+        niddle = encode_niddle(query)
     else:
         scorer = fzy_scorer
 
-    scored = apply_score(scorer, query, candidates, enable_icon)
-    ranked = sorted(scored, key=lambda x: x['score'], reverse=True)
+    native = scorer is not substr_scorer and NATIVE_FZY_SCORER
+
+    #  Skip the icon and the following space, 2 chars or 4 bytes, the
+    #  positions are always in bytes.
+    if not enable_icon:
+        offset, index_adjust = 0, 0
+    elif native:
+        offset, index_adjust = 4, 4
+    else:
+        offset, index_adjust = 2, 4
+
+    if scorer is substr_scorer:
+        cache = None
+    else:
+        cache = get_precomp(offset, len(candidates))
+
+    matched = None
+    if scorer is fzy_score_only_jit:
+        matched = rank_jit(niddle, candidates, offset, top_k)
+
+    if matched is not None:
+        ranked = [(None, None, c) for c in matched[0]]
+        rest = matched[1]
+    else:
+        scored = apply_score(scorer, niddle, candidates, offset, index_adjust,
+                             top_k, cache)
+        if top_k is None or len(scored) <= top_k:
+            ranked = sorted(scored, key=BY_SCORE, reverse=True)
+            rest = []
+        else:
+            ranked = heapq.nlargest(top_k, scored, key=BY_SCORE)
+            ranked_ids = set(map(id, ranked))
+            rest = [r[2] for r in scored if id(r) not in ranked_ids]
+
+    if scorer is fzy_score_only_jit:
+        #  Fill in the positions left empty by the score only kernel.
+        for idx, (score, positions, c) in enumerate(ranked):
+            if positions is None or not len(positions):
+                positions = fzy_scorer_jit(niddle, c, SCORE_MIN, cache, offset,
+                                           index_adjust)[1]
+                ranked[idx] = (score, positions, c)
+
+    filtered = [r[2] for r in ranked]
+    filtered.extend(rest)
+    #  The fzy scorers may return the positions in array('i') or numpy
+    #  array, which pyxeval can not convert, only the ranked ones are turned
+    #  into list.
+    indices = [
+        r[1] if isinstance(r[1], list) else r[1].tolist() for r in ranked
+    ]
 
-    indices = []
-    filtered = []
-    for r in ranked:
-        filtered.append(r['text'])
-        indices.append(r['indices'])
+    if cache is not None:
+        keep_precomp(offset, filtered)
 
     return (indices, filtered)
 
 
+def clap_fzy_clean_up():
+    """
+    Drop the cached candidates once clap exits.
+    """
+    _PRECOMP.clear()
+
+
 def clap_fzy_py():
-    return fuzzy_match_py(vim.eval("a:query"), vim.eval("a:candidates"),
-                          str2bool(vim.eval("a:context")['enable_icon']))
+    #  Evaluate all the arguments in one call, only the lines that can be
+    #  displayed at once need to be ranked.
+    query, candidates, enable_icon, top_k = vim.eval(
+        '[a:query, a:candidates, a:context.enable_icon, '
+        'get(g:clap.display, "preload_capacity", 2*&lines)]')
+    return fuzzy_match_py(query, candidates, str2bool(enable_icon), int(top_k))
 
 
 try:
     from clap.fuzzymatch_rs import fuzzy_match as fuzzy_match_rs
 
     def clap_fzy_rs():
-        return fuzzy_match_rs(vim.eval("a:query"), vim.eval("a:candidates"),
-                              vim.eval("a:recent_files"),
-                              vim.eval("a:context"))
+        return fuzzy_match_rs(*vim.eval(
+            '[a:query, a:candidates, a:recent_files, a:context]'))
 except Exception:
     pass
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from array import array
 from functools import partial
 
 #  Credit: https://github.com/aslpavel/sweep.py/blob/master/sweep.py
@@ -41,31 +42,62 @@ BONUS_STATES = [{}, BONUS_MAP, lower_with(SCORE_MATCH_CAPITAL, BONUS_MAP)]
 BONUS_INDEX = digit_with(1, lower_with(1, upper_with(2, {})))
 
 
+def build_bonus_lut():
+    """
+    Flatten BONUS_STATES and BONUS_INDEX into a 256x256 table over bytes,
+    indexed as BONUS_LUT[c_prev][c]
+    """
+    lut = [[0.0] * 256 for _ in range(256)]
+    for c in range(256):
+        for c_prev, v in BONUS_STATES[BONUS_INDEX.get(chr(c), 0)].items():
+            lut[ord(c_prev)][c] = v
+    return lut
+
+
+BONUS_LUT = build_bonus_lut()
+
+
 def bonus(haystack):
     """
     Additional bonus based on previous char in haystack
     """
-    c_prev = "/"
-    bonus = []
-    for c in haystack:
-        bonus.append(BONUS_STATES[BONUS_INDEX.get(c, 0)].get(c_prev, 0))
-        c_prev = c
-    return bonus
+    if isinstance(haystack, bytes):
+        #  Python 2, where bytes is str and only bytearray gives the ints.
+        haystack = bytearray(haystack)
+    else:
+        #  Any char out of latin-1 has no bonus either way, "?" keeps it so.
+        haystack = haystack.encode('latin-1', 'replace')
+    rows = map(BONUS_LUT.__getitem__, b'/' + haystack)
+    return [row[c] for row, c in zip(rows, haystack)]
 
 
 def subsequence(niddle, haystack):
     """
-    Check if niddle is subsequence of haystack
+    Return the first match positions if niddle is subsequence of haystack,
+    otherwise None. Both niddle and haystack are expected to be lowercased
+    unless the match is case sensitive.
     """
-    niddle, haystack = niddle.lower(), haystack.lower()
-    if not niddle:
-        return True
+    first = []
     offset = 0
     for char in niddle:
         offset = haystack.find(char, offset) + 1
         if offset <= 0:
-            return False
-    return True
+            return None
+        first.append(offset - 1)
+    return first
+
+
+def score_upper_bound(niddle, haystack, first):
+    """
+    Upper bound of the score, no matched char can do better than
+    SCORE_MATCH_CONSECUTIVE, the leading gap is at least up to the first
+    match of niddle[0] and the trailing gap is at least from the last
+    occurrence of niddle[-1].
+    """
+    n, m = len(niddle), len(haystack)
+    last = haystack.rfind(niddle[-1])
+    return (n * SCORE_MATCH_CONSECUTIVE + first[0] * SCORE_GAP_LEADING +
+            (m - 1 - last) * SCORE_GAP_TRAILING)
 
 
 def compute(niddle, haystack):
@@ -110,7 +142,7 @@ def compute(niddle, haystack):
 def positions(niddle, haystack):
     n, m = len(niddle), len(haystack)
 
-    positions = [0] * n
+    positions = array('i', [0]) * n
 
     if n == 0 or m == 0:
         return positions
@@ -142,25 +174,36 @@ def positions(niddle, haystack):
     return M[n - 1][m - 1], positions
 
 
-def score(niddle, haystack):
+def score(niddle, haystack, haystack_lc=None, first=None, bonus_score=None,
+          index_adjust=0):
     """
     Calculate score, and positions of haystack
+
+    `first` is the first match positions returned by subsequence(), no match
+    of niddle[i] can happen before first[i].
+
+    `index_adjust` is added to the positions returned.
     """
     n, m = len(niddle), len(haystack)
-    bonus_score = bonus(haystack)
+    if bonus_score is None:
+        bonus_score = bonus(haystack)
 
     if niddle.islower():
-        haystack = haystack.lower()
+        haystack = haystack.lower() if haystack_lc is None else haystack_lc
 
     if n == 0 or n == m:
-        return SCORE_MAX, list(range(n))
-    D = [[0] * m for _ in range(n)]  # best score ending with `niddle[:i]`
-    M = [[0] * m for _ in range(n)]  # best score for `niddle[:i]`
+        return SCORE_MAX, array('i', range(index_adjust, index_adjust + n))
+    if first is None:
+        first = [0] * n
+    #  best score ending with `niddle[:i]`
+    D = [[SCORE_MIN] * m for _ in range(n)]
+    #  best score for `niddle[:i]`
+    M = [[SCORE_MIN] * m for _ in range(n)]
     for i in range(n):
         prev_score = SCORE_MIN
         gap_score = SCORE_GAP_TRAILING if i == n - 1 else SCORE_GAP_INNER
 
-        for j in range(m):
+        for j in range(first[i], m):
             if niddle[i] == haystack[j]:
                 score = SCORE_MIN
                 if i == 0:
@@ -177,14 +220,14 @@ def score(niddle, haystack):
                 M[i][j] = prev_score = prev_score + gap_score
 
     match_required = False
-    positions = [0] * n
+    positions = array('i', [0]) * n
     i, j = n - 1, m - 1
     while i >= 0:
         while j >= 0:
             if (match_required or D[i][j] == M[i][j]) and D[i][j] != SCORE_MIN:
                 match_required = (i > 0 and j > 0 and M[i][j]
                                   == D[i - 1][j - 1] + SCORE_MATCH_CONSECUTIVE)
-                positions[i] = j
+                positions[i] = j + index_adjust
                 j -= 1
                 break
             else:
@@ -194,36 +237,74 @@ def score(niddle, haystack):
     return M[n - 1][m - 1], positions
 
 
-def fzy_scorer(niddle, haystack):
-    if subsequence(niddle, haystack):
-        return score(niddle, haystack)
-    else:
+def fzy_scorer(niddle, haystack, threshold=SCORE_MIN, cache=None, offset=0,
+               index_adjust=0):
+    """
+    Return (SCORE_MIN, None) if haystack does not match.
+
+    If the score can not reach `threshold`, the DP is skipped and the upper
+    bound of the score is returned with empty positions.
+
+    `cache` is a dict keeping the sliced and lowercased haystack, which do
+    not depend on niddle, across the calls. The cached haystack is sliced at
+    `offset`, so a cache must not be shared by different offsets.
+
+    Only `haystack[offset:]` is matched, and `index_adjust` is added to the
+    positions returned, e.g., to skip the icon.
+
+    The positions are an array('i'), use tolist() for a list.
+    """
+    prepared = None if cache is None else cache.get(haystack)
+    if prepared is None:
+        #  str has no view, slice it here once so that the cached haystacks
+        #  are not sliced again on the next keystrokes.
+        text = haystack[offset:] if offset else haystack
+        text_lc = text.lower()
+        #  Most of the paths are lowercased already, share the str then.
+        prepared = (text, text if text_lc == text else text_lc)
+        if cache is not None:
+            cache[haystack] = prepared
+    text, text_lc = prepared
+    #  Smart case, same as score(), so that the pruned haystacks do match.
+    text_cmp = text_lc if niddle.islower() else text
+    first = subsequence(niddle, text_cmp)
+    if first is None:
         return SCORE_MIN, None
+    if threshold > SCORE_MIN and 0 < len(niddle) < len(text):
+        upper_bound = score_upper_bound(niddle, text_cmp, first)
+        if upper_bound < threshold:
+            return upper_bound, []
+    #  The bonus is O(m) next to the O(nm) DP, not worth caching.
+    return score(niddle, text, text_lc, first, None, index_adjust)
 
 
-def substr_impl(niddle, haystack):
+def substr_impl(niddle, haystack, offset=0, index_adjust=0):
     niddle, haystack = niddle.lower(), haystack.lower()
-    offset = haystack.find(niddle, 0)
-    if offset < 0:
-        return float("-inf"), None
-    positions = range(offset, offset + len(niddle))
+    start = haystack.find(niddle, offset)
+    if start < 0:
+        return SCORE_MIN, None
+    start -= offset
+    positions = range(start, start + len(niddle))
     if not positions:
         return 0, positions
     match_len = positions[-1] + 1 - positions[0]
-    return -match_len + 2 / (positions[0] + 1) + 1 / (positions[-1] +
-                                                      1), positions
+    return (-match_len + 2 / (positions[0] + 1) + 1 / (positions[-1] + 1),
+            range(start + index_adjust, start + index_adjust + len(niddle)))
 
 
-def substr_scorer(niddle, haystack):
-    positions, offset = [], 0
+#  `threshold` and `cache` are accepted for the same signature as fzy_scorer,
+#  the substring match is cheap enough to not bother with them.
+def substr_scorer(niddle, haystack, threshold=SCORE_MIN, cache=None, offset=0,
+                  index_adjust=0):
+    positions = []
     niddle, haystack = niddle.lower(), haystack.lower()
     total_score = 0
     for niddle in niddle.split(" "):
         if not niddle:
             continue
-        score, indices = substr_impl(niddle, haystack)
+        score, indices = substr_impl(niddle, haystack, offset, index_adjust)
         if indices is None:
-            return float("-inf"), None
+            return SCORE_MIN, None
         total_score += score
         positions.extend(indices)
     return total_score, sorted(positions)
@@ -0,0 +1,199 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+
+#  Cython implementation of clap.scorer.fzy_scorer, for the environments
+#  where the Rust dynamic module can not be built but a C compiler exists:
+#
+#    make cython
+#
+#  Same as clap.scorer_jit, the DP runs on the UTF-8 bytes of the candidate,
+#  hence the positions returned are byte offsets, and the surrogate escapes
+#  of the lines which are not valid UTF-8 are encoded back to their bytes.
+
+from libc.stdlib cimport free, malloc
+
+from clap import scorer
+
+cdef double SCORE_MIN = scorer.SCORE_MIN
+cdef double SCORE_MAX = scorer.SCORE_MAX
+cdef double SCORE_GAP_LEADING = scorer.SCORE_GAP_LEADING
+cdef double SCORE_GAP_TRAILING = scorer.SCORE_GAP_TRAILING
+cdef double SCORE_GAP_INNER = scorer.SCORE_GAP_INNER
+cdef double SCORE_MATCH_CONSECUTIVE = scorer.SCORE_MATCH_CONSECUTIVE
+
+#  The DP buffers are on the stack if bonus, D and M fit in STACK_CELLS,
+#  and so are the positions if niddle is not longer than STACK_NIDDLE.
+cdef enum:
+    STACK_CELLS = 8192
+    STACK_NIDDLE = 64
+
+cdef double BONUS_LUT[256][256]
+cdef unsigned char LOWER[256]
+
+
+cdef void init_tables():
+    cdef int c_prev, c
+    for c_prev, row in enumerate(scorer.build_bonus_lut()):
+        for c, v in enumerate(row):
+            BONUS_LUT[c_prev][c] = v
+    for c in range(256):
+        LOWER[c] = c + 32 if 65 <= c <= 90 else c
+
+
+init_tables()
+
+
+cdef void bonus(const unsigned char *haystack, Py_ssize_t m,
+                double *bonus_score) noexcept nogil:
+    cdef unsigned char c_prev = 47  # ord('/')
+    cdef Py_ssize_t j
+    for j in range(m):
+        bonus_score[j] = BONUS_LUT[c_prev][haystack[j]]
+        c_prev = haystack[j]
+
+
+cdef inline bint char_eq(unsigned char a, unsigned char b,
+                         bint ignore_case) noexcept nogil:
+    if ignore_case:
+        return a == LOWER[b]
+    return a == b
+
+
+#  Same smart case as score(), so that the pruned haystacks do match.
+cdef bint subsequence(const unsigned char *niddle, Py_ssize_t n,
+                      const unsigned char *haystack, Py_ssize_t m,
+                      bint ignore_case, Py_ssize_t *first) noexcept nogil:
+    cdef Py_ssize_t i = 0, j
+    for j in range(m):
+        if i < n and char_eq(niddle[i], haystack[j], ignore_case):
+            first[i] = j
+            i += 1
+    return i == n
+
+
+cdef double score_upper_bound(const unsigned char *niddle, Py_ssize_t n,
+                              const unsigned char *haystack, Py_ssize_t m,
+                              bint ignore_case,
+                              const Py_ssize_t *first) noexcept nogil:
+    cdef Py_ssize_t last = m - 1
+    while not char_eq(niddle[n - 1], haystack[last], ignore_case):
+        last -= 1
+    return (n * SCORE_MATCH_CONSECUTIVE + first[0] * SCORE_GAP_LEADING +
+            (m - 1 - last) * SCORE_GAP_TRAILING)
+
+
+cdef double score(const unsigned char *niddle, Py_ssize_t n,
+                  const unsigned char *haystack, Py_ssize_t m,
+                  bint ignore_case, const Py_ssize_t *first,
+                  double *bonus_score, double *D, double *M,
+                  Py_ssize_t *positions) noexcept nogil:
+    """
+    D and M are the flattened n*m matrices, indexed as D[i * m + j].
+    """
+    cdef Py_ssize_t i, j, row
+    cdef double prev_score, gap_score, s
+    cdef bint match_required = False
+
+    bonus(haystack, m, bonus_score)
+
+    for i in range(n):
+        row = i * m
+        prev_score = SCORE_MIN
+        gap_score = SCORE_GAP_TRAILING if i == n - 1 else SCORE_GAP_INNER
+
+        for j in range(first[i]):
+            D[row + j] = SCORE_MIN
+            M[row + j] = SCORE_MIN
+
+        for j in range(first[i], m):
+            if char_eq(niddle[i], haystack[j], ignore_case):
+                s = SCORE_MIN
+                if i == 0:
+                    s = j * SCORE_GAP_LEADING + bonus_score[j]
+                elif j != 0:
+                    s = max(
+                        M[row - m + j - 1] + bonus_score[j],
+                        D[row - m + j - 1] + SCORE_MATCH_CONSECUTIVE,
+                    )
+                D[row + j] = s
+                prev_score = max(s, prev_score + gap_score)
+                M[row + j] = prev_score
+            else:
+                D[row + j] = SCORE_MIN
+                prev_score = prev_score + gap_score
+                M[row + j] = prev_score
+
+    i, j = n - 1, m - 1
+    while i >= 0:
+        row = i * m
+        while j >= 0:
+            if (match_required or D[row + j] == M[row + j]) and D[row + j] != SCORE_MIN:
+                match_required = (i > 0 and j > 0 and M[row + j]
+                                  == D[row - m + j - 1] + SCORE_MATCH_CONSECUTIVE)
+                positions[i] = j
+                j -= 1
+                break
+            else:
+                j -= 1
+        i -= 1
+
+    return M[n * m - 1]
+
+
+def fzy_scorer(niddle, haystack, double threshold=SCORE_MIN, cache=None,
+               Py_ssize_t offset=0, Py_ssize_t index_adjust=0):
+    """
+    Same as clap.scorer.fzy_scorer, but `offset` is in bytes.
+
+    `cache` is ignored, encoding the haystack costs no more than looking it
+    up in a dict.
+    """
+    cdef bytes niddle_bytes = niddle.encode('utf-8', 'surrogateescape')
+    cdef bytes haystack_bytes = haystack.encode('utf-8', 'surrogateescape')
+    cdef const unsigned char *nd = niddle_bytes
+    cdef Py_ssize_t n = len(niddle_bytes)
+    cdef Py_ssize_t m = max(len(haystack_bytes) - offset, 0)
+    cdef const unsigned char *hs = haystack_bytes
+    cdef bint ignore_case = niddle.islower()
+    cdef double stack_cells[STACK_CELLS]
+    cdef Py_ssize_t stack_indices[2 * STACK_NIDDLE]
+    cdef double *cells = stack_cells
+    cdef Py_ssize_t *indices = stack_indices
+    cdef double s, upper_bound
+
+    if n == 0:
+        return SCORE_MAX, []
+    hs += len(haystack_bytes) - m
+
+    if n > STACK_NIDDLE:
+        indices = <Py_ssize_t *> malloc(2 * n * sizeof(Py_ssize_t))
+        if indices == NULL:
+            raise MemoryError()
+    try:
+        if not subsequence(nd, n, hs, m, ignore_case, indices):
+            return SCORE_MIN, None
+        if n == m:
+            return SCORE_MAX, list(range(index_adjust, index_adjust + n))
+        if threshold > SCORE_MIN:
+            upper_bound = score_upper_bound(nd, n, hs, m, ignore_case,
+                                            indices)
+            if upper_bound < threshold:
+                return upper_bound, []
+
+        if (2 * n + 1) * m > STACK_CELLS:
+            cells = <double *> malloc((2 * n + 1) * m * sizeof(double))
+            if cells == NULL:
+                raise MemoryError()
+        try:
+            with nogil:
+                s = score(nd, n, hs, m, ignore_case, indices, cells,
+                          cells + m, cells + m + n * m, indices + n)
+        finally:
+            if cells != stack_cells:
+                free(cells)
+
+        if s == SCORE_MIN:
+            return SCORE_MIN, None
+        return s, [indices[n + i] + index_adjust for i in range(n)]
+    finally:
+        if indices != stack_indices:
+            free(indices)
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#  Numba implementation of the fzy algorithm of clap.scorer.
+#
+#  The DP runs on the UTF-8 bytes of the candidate, hence the positions
+#  returned are byte offsets, which is exactly what the highlight wants.
+#  The lines which are not valid UTF-8 come with surrogate escapes, those
+#  are encoded back to the original bytes, as Vim sees them.
+
+import threading
+
+import numpy as np
+from numba import njit
+
+from clap.scorer import (SCORE_GAP_INNER, SCORE_GAP_LEADING,
+                         SCORE_GAP_TRAILING, SCORE_MATCH_CONSECUTIVE,
+                         SCORE_MAX, SCORE_MIN, build_bonus_lut)
+
+#  The backtracking relies on exact equality, so contract(fma) is left out
+#  of the fastmath flags.
+FASTMATH = {'nnan', 'ninf', 'nsz', 'arcp', 'afn', 'reassoc'}
+
+#  Finite stand-ins of SCORE_MIN and SCORE_MAX in the kernel, which has no
+#  inf under the fastmath flags. The gaps and bonuses are far below the ulp
+#  of 1e30, so KERNEL_SCORE_MIN stays exact through the DP as -inf does.
+KERNEL_SCORE_MIN = -1e30
+KERNEL_SCORE_MAX = 1e30
+
+#  BONUS_LUT[c_prev, c]
+BONUS_LUT = np.array(build_bonus_lut(), dtype=np.float64)
+
+
+@njit(cache=True, fastmath=FASTMATH, nogil=True)
+def _bonus(haystack):
+    bonus = np.empty(haystack.shape[0], dtype=np.float64)
+    c_prev = 47  # ord('/')
+    for j in range(haystack.shape[0]):
+        c = haystack[j]
+        bonus[j] = BONUS_LUT[c_prev, c]
+        c_prev = c
+    return bonus
+
+
+#  The niddles up to SMALL_NIDDLE bytes can be scored by _fzy_score_small.
+SMALL_NIDDLE = 4
+
+
+@njit(cache=True, fastmath=FASTMATH, nogil=True)
+def _fzy_score_small(niddle, haystack, haystack_cmp):
+    """
+    Score only version of the DP in _fzy_score for the niddles up to
+    SMALL_NIDDLE bytes.
+
+    The DP is swept column by column, the rows of D and M are kept in the
+    locals d0..d3 and m0..m3 instead of the matrices. Within a column the
+    rows are updated from the last one, so that row i still sees the
+    previous column of row i - 1.
+    """
+    n, m = niddle.shape[0], haystack.shape[0]
+    c0 = niddle[0]
+    c1 = niddle[1] if n > 1 else 0
+    c2 = niddle[2] if n > 2 else 0
+    c3 = niddle[3] if n > 3 else 0
+    g0 = SCORE_GAP_TRAILING if n == 1 else SCORE_GAP_INNER
+    g1 = SCORE_GAP_TRAILING if n == 2 else SCORE_GAP_INNER
+    g2 = SCORE_GAP_TRAILING if n == 3 else SCORE_GAP_INNER
+    g3 = SCORE_GAP_TRAILING
+    d0 = d1 = d2 = d3 = KERNEL_SCORE_MIN
+    m0 = m1 = m2 = m3 = KERNEL_SCORE_MIN
+
+    c_prev = 47  # ord('/')
+    for j in range(m):
+        c = haystack[j]
+        bonus = BONUS_LUT[c_prev, c]
+        c_prev = c
+        h = haystack_cmp[j]
+
+        if n > 3:
+            if h == c3 and j != 0:
+                d3 = max(m2 + bonus, d2 + SCORE_MATCH_CONSECUTIVE)
+                m3 = max(d3, m3 + g3)
+            else:
+                d3 = KERNEL_SCORE_MIN
+                m3 = m3 + g3
+        if n > 2:
+            if h == c2 and j != 0:
+                d2 = max(m1 + bonus, d1 + SCORE_MATCH_CONSECUTIVE)
+                m2 = max(d2, m2 + g2)
+            else:
+                d2 = KERNEL_SCORE_MIN
+                m2 = m2 + g2
+        if n > 1:
+            if h == c1 and j != 0:
+                d1 = max(m0 + bonus, d0 + SCORE_MATCH_CONSECUTIVE)
+                m1 = max(d1, m1 + g1)
+            else:
+                d1 = KERNEL_SCORE_MIN
+                m1 = m1 + g1
+        if h == c0:
+            d0 = j * SCORE_GAP_LEADING + bonus
+            m0 = max(d0, m0 + g0)
+        else:
+            d0 = KERNEL_SCORE_MIN
+            m0 = m0 + g0
+
+    if n == 1:
+        return m0
+    if n == 2:
+        return m1
+    if n == 3:
+        return m2
+    return m3
+
+
+@njit(cache=True, fastmath=FASTMATH, nogil=True)
+def _fzy_score(niddle, haystack, haystack_lc, threshold, index_adjust,
+               with_positions, D, M):
+    n, m = niddle.shape[0], haystack.shape[0]
+    positions = np.zeros(n, dtype=np.int32)
+
+    #  Smart case, same as `niddle.islower()` in clap.scorer.
+    case_sensitive = False
+    for i in range(n):
+        if 65 <= niddle[i] <= 90:
+            case_sensitive = True
+            break
+    if case_sensitive:
+        haystack_cmp = haystack
+    else:
+        haystack_cmp = haystack_lc
+
+    i = 0
+    first = 0
+    for j in range(m):
+        if i < n and niddle[i] == haystack_cmp[j]:
+            if i == 0:
+                first = j
+            i += 1
+    if i < n:
+        return KERNEL_SCORE_MIN, positions
+
+    if n == 0 or n == m:
+        for i in range(n):
+            positions[i] = i + index_adjust
+        return KERNEL_SCORE_MAX, positions
+
+    #  Same as clap.scorer.score_upper_bound.
+    last = m - 1
+    while haystack_cmp[last] != niddle[n - 1]:
+        last -= 1
+    upper_bound = (n * SCORE_MATCH_CONSECUTIVE + first * SCORE_GAP_LEADING +
+                   (m - 1 - last) * SCORE_GAP_TRAILING)
+    if upper_bound < threshold:
+        return upper_bound, positions[:0]
+
+    if not with_positions and n <= SMALL_NIDDLE:
+        return _fzy_score_small(niddle, haystack, haystack_cmp), positions[:0]
+
+    #  D and M are the flattened n*m matrices, indexed as D[i * m + j].
+    bonus_score = _bonus(haystack)
+    for i in range(n):
+        row = i * m
+        prev_score = KERNEL_SCORE_MIN
+        gap_score = SCORE_GAP_TRAILING if i == n - 1 else SCORE_GAP_INNER
+
+        for j in range(m):
+            if niddle[i] == haystack_cmp[j]:
+                score = KERNEL_SCORE_MIN
+                if i == 0:
+                    score = j * SCORE_GAP_LEADING + bonus_score[j]
+                elif j != 0:
+                    score = max(
+                        M[row - m + j - 1] + bonus_score[j],
+                        D[row - m + j - 1] + SCORE_MATCH_CONSECUTIVE,
+                    )
+                D[row + j] = score
+                prev_score = max(score, prev_score + gap_score)
+                M[row + j] = prev_score
+            else:
+                D[row + j] = KERNEL_SCORE_MIN
+                prev_score = prev_score + gap_score
+                M[row + j] = prev_score
+
+    match_required = False
+    i, j = n - 1, m - 1
+    while i >= 0:
+        row = i * m
+        while j >= 0:
+            if ((match_required or D[row + j] == M[row + j])
+                    and D[row + j] != KERNEL_SCORE_MIN):
+                match_required = (
+                    i > 0 and j > 0 and M[row + j]
+                    == D[row - m + j - 1] + SCORE_MATCH_CONSECUTIVE)
+                positions[i] = j + index_adjust
+                j -= 1
+                break
+            else:
+                j -= 1
+        i -= 1
+
+    return M[n * m - 1], positions
+
+
+#  Scratch buffers of D and M shared by all the candidates scored in the
+#  same thread.
+_buffers = threading.local()
+
+#  The largest scratch buffers kept in a thread, 1MiB for D and M together.
+MAX_KEPT_CELLS = 1 << 16
+
+
+def reserve_buffers(size):
+    """
+    Return the scratch buffers of the current thread, which can hold at
+    least `size` cells
+
+    The buffers larger than MAX_KEPT_CELLS are not kept, so that a single
+    very long line does not pin the memory in every thread.
+    """
+    if size > MAX_KEPT_CELLS:
+        return (np.empty(size, dtype=np.float64),
+                np.empty(size, dtype=np.float64))
+    D = getattr(_buffers, 'D', None)
+    if D is None or D.shape[0] < size:
+        if D is not None:
+            size = min(max(size, 2 * D.shape[0]), MAX_KEPT_CELLS)
+        _buffers.D = np.empty(size, dtype=np.float64)
+        _buffers.M = np.empty(size, dtype=np.float64)
+    return _buffers.D, _buffers.M
+
+
+def encode_niddle(niddle):
+    return np.frombuffer(niddle.encode('utf-8', 'surrogateescape'),
+                         dtype=np.uint8)
+
+
+def prepare(haystack, offset=0):
+    raw = haystack.encode('utf-8', 'surrogateescape')
+    offset = min(offset, len(raw))
+    return (np.frombuffer(raw, dtype=np.uint8, offset=offset),
+            np.frombuffer(raw.lower(), dtype=np.uint8, offset=offset))
+
+
+def _fzy_scorer(niddle, haystack, threshold, cache, offset, index_adjust,
+                with_positions):
+    prepared = None if cache is None else cache.get(haystack)
+    if prepared is None:
+        prepared = prepare(haystack, offset)
+        if cache is not None:
+            cache[haystack] = prepared
+    haystack_bytes, haystack_lc = prepared
+    D, M = reserve_buffers(niddle.shape[0] * haystack_bytes.shape[0])
+    score, positions = _fzy_score(niddle, haystack_bytes, haystack_lc,
+                                  max(threshold, KERNEL_SCORE_MIN),
+                                  index_adjust, with_positions, D, M)
+    if score <= KERNEL_SCORE_MIN:
+        return SCORE_MIN, None
+    if score >= KERNEL_SCORE_MAX:
+        return SCORE_MAX, positions
+    return score, positions
+
+
+def fzy_scorer(niddle, haystack, threshold=SCORE_MIN, cache=None, offset=0,
+               index_adjust=0):
+    """
+    Same as clap.scorer.fzy_scorer, but `niddle` is the query encoded by
+    `encode_niddle`, `offset` is in bytes and the positions are a numpy
+    array.
+
+    Only the encoded haystack is cached, the bonus is cheap compared to the
+    DP and computed in the kernel after the subsequence check. Same as
+    clap.scorer.fzy_scorer, a cache must not be shared by different offsets.
+    """
+    return _fzy_scorer(niddle, haystack, threshold, cache, offset,
+                       index_adjust, True)
+
+
+def fzy_score_only(niddle, haystack, threshold=SCORE_MIN, cache=None,
+                   offset=0, index_adjust=0):
+    """
+    Same as fzy_scorer, but the positions are left empty for the niddles up
+    to SMALL_NIDDLE bytes, which are scored without the D and M matrices.
+    """
+    return _fzy_scorer(niddle, haystack, threshold, cache, offset,
+                       index_adjust, False)
+
+
+@njit(cache=True, fastmath=FASTMATH, nogil=True)
+def _fzy_score_lines(niddle, buf, buf_lc, starts, ends, top_k):
+    """
+    Score only _fzy_score of the lines buf[starts[k]:ends[k]], pruned by the
+    `top_k` best scores so far if `top_k` is positive.
+    """
+    n, count = niddle.shape[0], starts.shape[0]
+    width = 0
+    for k in range(count):
+        width = max(width, ends[k] - starts[k])
+    D = np.empty(n * width, dtype=np.float64)
+    M = np.empty(n * width, dtype=np.float64)
+    scores = np.empty(count, dtype=np.float64)
+
+    #  Min heap of the best `top_k` scores, same as heapq in apply_score.
+    heap = np.full(max(top_k, 1), KERNEL_SCORE_MIN)
+    for k in range(count):
+        threshold = heap[0] if top_k > 0 else KERNEL_SCORE_MIN
+        score, _ = _fzy_score(niddle, buf[starts[k]:ends[k]],
+                              buf_lc[starts[k]:ends[k]], threshold, 0, False,
+                              D, M)
+        scores[k] = score
+        if top_k > 0 and score > heap[0]:
+            i = 0
+            while True:
+                child = 2 * i + 1
+                if child >= top_k:
+                    break
+                if child + 1 < top_k and heap[child + 1] < heap[child]:
+                    child += 1
+                if heap[child] >= score:
+                    break
+                heap[i] = heap[child]
+                i = child
+            heap[i] = score
+    return scores
+
+
+def fzy_scores(niddle, lines, offset=0, top_k=0):
+    """
+    Same as the scores of fzy_score_only for all the `lines`, but the loop
+    over the lines runs in the kernel, which releases the GIL for the whole
+    chunk rather than for the DP of a single line.
+
+    Return None if a line contains a newline, which is the separator of the
+    lines in the encoded buffer.
+    """
+    if not lines:
+        return np.empty(0, dtype=np.float64)
+    raw = '\n'.join(lines).encode('utf-8', 'surrogateescape')
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    ends = np.flatnonzero(buf == 10)
+    if ends.shape[0] != len(lines) - 1:
+        return None
+    starts = np.empty(len(lines), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends + 1
+    ends = np.append(ends, len(raw))
+    starts = np.minimum(starts + offset, ends)
+
+    scores = _fzy_score_lines(niddle, buf,
+                              np.frombuffer(raw.lower(), dtype=np.uint8),
+                              starts, ends, top_k)
+    scores[scores <= KERNEL_SCORE_MIN] = SCORE_MIN
+    scores[scores >= KERNEL_SCORE_MAX] = SCORE_MAX
+    return scores
+
+
+def rank_scores(chunks, top_k):
+    """
+    Return the indices of the `top_k` best matches, best first, and of the
+    rest matches in the original order, given the scores of fzy_scores of
+    the consecutive chunks of the candidates.
+
+    The ties are ranked in the original order, same as heapq.nlargest.
+    """
+    scores = np.concatenate(chunks)
+    matched = np.flatnonzero(scores > SCORE_MIN)
+    order = matched[np.argsort(-scores[matched], kind='stable')]
+    rest = np.sort(order[top_k:])
+    return order[:top_k].tolist(), rest.tolist()
@@ -5,9 +5,10 @@ import itertools
 import random
 import re
 import string
+from operator import itemgetter
 
 import fuzzymatch_rs
-from fzy_impl import fzy_scorer
+from scorer import fzy_scorer
 
 
 def fuzzy_match_py(query, candidates):
@@ -16,15 +17,15 @@ def fuzzy_match_py(query, candidates):
     for c in candidates:
         score, indices = fzy_scorer(query, c)
         if score != float("-inf"):
-            scored.append({'score': score, 'indices': indices, 'text': c})
+            scored.append((score, indices, c))
 
-    ranked = sorted(scored, key=lambda x: x['score'], reverse=True)
+    ranked = sorted(scored, key=itemgetter(0), reverse=True)
 
     indices = []
     filtered = []
-    for r in ranked:
-        filtered.append(r['text'])
-        indices.append(r['indices'])
+    for _, idx, text in ranked:
+        filtered.append(text)
+        indices.append(idx)
 
     return (indices, filtered)
 
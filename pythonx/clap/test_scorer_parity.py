@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  Check that the numba and Cython versions of the fzy scorer give the same
+#  scores and positions as clap.scorer, the compiled ones are skipped if not
+#  available. Also check that pruning by the top_k scores, in the scorers and
+#  in clap.fzy, ranks and matches the same lines as without pruning.
+#
+#  The compiled scorers work on the UTF-8 bytes, so the gaps of non-ASCII
+#  candidates are counted in bytes, only the ASCII candidates are compared.
+#  The exception are the lines which are not valid UTF-8, every byte of
+#  those is either ASCII or a surrogate escape, one char either way.
+#
+#    python3 -m pytest test_scorer_parity.py
+
+import math
+import os
+import random
+import sys
+import types
+
+import pytest
+
+from clap import scorer
+
+QUERIES = ['s', 'sr', 'fzy', 'py', 'Cargo', 'RS', 'clapvim', 'srcmainrs']
+
+#  The numbers of the ranked lines to check the pruning by.
+TOP_KS = [1, 5, 40]
+
+#  The thresholds to prune the candidates by, the best scores of the queries
+#  are around these.
+THRESHOLDS = [0.0, 1.0, 2.0, 4.0]
+
+#  The icon and the following space, 2 chars, 4 bytes.
+ICON = ' '
+
+
+def candidates():
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')
+                       and d != 'target']
+        for f in filenames:
+            paths.append(os.path.relpath(os.path.join(dirpath, f), root))
+    paths = sorted(p for p in paths if p.isascii())
+    rng = random.Random(42)
+    alphabet = 'srcmainfzyRSC_-/. '
+    paths.extend(''.join(rng.choice(alphabet)
+                         for _ in range(rng.randint(1, 40)))
+                 for _ in range(2000))
+    paths.extend(line.decode('utf-8', 'surrogateescape')
+                 for line in LATIN1_LINES)
+    return paths
+
+
+#  As grep gives them from the latin-1 files.
+LATIN1_LINES = [
+    b'src/caf\xe9.rs:1:fn main() {}',
+    b'na\xefve_fzy.py',
+    b'\xc0\xff Cargo.toml',
+]
+
+CANDIDATES = candidates()
+
+
+def expected(query, candidate):
+    #  clap.scorer returns SCORE_MAX without comparing the case if niddle is
+    #  as long as haystack, which the compiled scorers do not follow.
+    if len(query) == len(candidate):
+        return None
+    score, positions = scorer.fzy_scorer(query, candidate)
+    if score == scorer.SCORE_MIN:
+        return scorer.SCORE_MIN, None
+    return score, list(positions)
+
+
+def check_parity(fzy_scorer, encode):
+    for query in QUERIES:
+        niddle = encode(query)
+        for candidate in CANDIDATES:
+            want = expected(query, candidate)
+            if want is None:
+                continue
+            score, positions = fzy_scorer(niddle, candidate)
+            if positions is not None:
+                positions = list(positions)
+            assert math.isclose(score, want[0]), (query, candidate)
+            assert positions == want[1], (query, candidate)
+
+            #  Skipping the icon gives the same result shifted by 4 bytes.
+            score, positions = fzy_scorer(niddle, ICON + candidate,
+                                          scorer.SCORE_MIN, None, 4, 4)
+            if positions is not None:
+                positions = [x - 4 for x in positions]
+            assert math.isclose(score, want[0]), (query, candidate)
+            assert positions == want[1], (query, candidate)
+
+
+def check_threshold(fzy_scorer, encode):
+    #  A pruned candidate must still match, and can not score above the
+    #  upper bound returned, nor reach the threshold.
+    for query in QUERIES:
+        niddle = encode(query)
+        for candidate in CANDIDATES:
+            want, _ = fzy_scorer(niddle, candidate)
+            for threshold in THRESHOLDS:
+                score, positions = fzy_scorer(niddle, candidate, threshold)
+                if want == scorer.SCORE_MIN:
+                    assert score == scorer.SCORE_MIN, (query, candidate)
+                elif positions is not None and not len(positions):
+                    assert want <= score < threshold, (query, candidate)
+                else:
+                    assert math.isclose(score, want), (query, candidate)
+
+
+def same_score(a, b):
+    return a == b or math.isclose(a, b)
+
+
+def check_ranked(fzy, query, candidates, enable_icon):
+    #  Only the first top_k lines are ranked, but the matched lines must be
+    #  the same.
+    indices, filtered = fzy.fuzzy_match_py(query, candidates, enable_icon)
+    for top_k in TOP_KS:
+        ranked = fzy.fuzzy_match_py(query, candidates, enable_icon, top_k)
+        assert ranked[0] == indices[:top_k], (query, top_k)
+        assert ranked[1][:top_k] == filtered[:top_k], (query, top_k)
+        assert sorted(ranked[1]) == sorted(filtered), (query, top_k)
+
+
+def import_fzy():
+    #  clap.fzy uses the vim module only in clap_fzy_py, which is not called
+    #  here.
+    sys.modules.setdefault('vim', types.ModuleType('vim'))
+    from clap import fzy
+    return fzy
+
+
+def test_scorer_threshold():
+    check_threshold(scorer.fzy_scorer, lambda query: query)
+
+
+def test_fuzzy_match_top_k(monkeypatch):
+    fzy = import_fzy()
+    #  The fzy_scorer imported by clap.fzy, without the numba batch path.
+    monkeypatch.setattr(fzy, 'fzy_scorer_jit', None)
+    monkeypatch.setattr(fzy, 'fzy_score_only_jit', None)
+    monkeypatch.setattr(fzy, 'NATIVE_FZY_SCORER',
+                        fzy.fzy_scorer.__module__ == 'clap.scorer_cy')
+    candidates = CANDIDATES[::4]
+    for query in QUERIES:
+        fzy.clap_fzy_clean_up()
+        check_ranked(fzy, query, candidates, False)
+        check_ranked(fzy, query, [ICON + c for c in candidates], True)
+
+
+def test_scorer_jit():
+    scorer_jit = pytest.importorskip('clap.scorer_jit')
+    check_parity(scorer_jit.fzy_scorer, scorer_jit.encode_niddle)
+    check_threshold(scorer_jit.fzy_scorer, scorer_jit.encode_niddle)
+
+
+def test_score_only_jit():
+    scorer_jit = pytest.importorskip('clap.scorer_jit')
+    icon_candidates = [ICON + c for c in CANDIDATES]
+    for query in QUERIES:
+        niddle = scorer_jit.encode_niddle(query)
+        scores = scorer_jit.fzy_scores(niddle, CANDIDATES)
+        icon_scores = scorer_jit.fzy_scores(niddle, icon_candidates, 4)
+        for k, candidate in enumerate(CANDIDATES):
+            want, _ = scorer_jit.fzy_scorer(niddle, candidate)
+            score, _ = scorer_jit.fzy_score_only(niddle, candidate)
+            assert same_score(score, want), (query, candidate)
+            assert same_score(scores[k], want), (query, candidate)
+            assert same_score(icon_scores[k], want), (query, candidate)
+
+
+def test_top_k_jit():
+    scorer_jit = pytest.importorskip('clap.scorer_jit')
+    for query in QUERIES:
+        niddle = scorer_jit.encode_niddle(query)
+        scores = scorer_jit.fzy_scores(niddle, CANDIDATES)
+        for top_k in TOP_KS:
+            want = scorer_jit.rank_scores([scores], top_k)
+            pruned = scorer_jit.fzy_scores(niddle, CANDIDATES, 0, top_k)
+            assert scorer_jit.rank_scores([pruned], top_k) == want
+            #  Each chunk is pruned by its own top_k, as on the threads.
+            chunks = [
+                scorer_jit.fzy_scores(niddle, CANDIDATES[i:i + 500], 0, top_k)
+                for i in range(0, len(CANDIDATES), 500)
+            ]
+            assert scorer_jit.rank_scores(chunks, top_k) == want
+
+
+def test_fuzzy_match_top_k_jit():
+    pytest.importorskip('clap.scorer_jit')
+    fzy = import_fzy()
+    if fzy.fzy_scorer_jit is None:
+        pytest.skip('clap.fzy prefers the Cython scorer')
+    for query in QUERIES:
+        fzy.clap_fzy_clean_up()
+        check_ranked(fzy, query, CANDIDATES, False)
+        check_ranked(fzy, query, [ICON + c for c in CANDIDATES], True)
+
+
+def test_scorer_cy():
+    scorer_cy = pytest.importorskip('clap.scorer_cy')
+    check_parity(scorer_cy.fzy_scorer, lambda query: query)
+    check_threshold(scorer_cy.fzy_scorer, lambda query: query)
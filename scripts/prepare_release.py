@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import fileinput
+import pathlib
+import re
 import sys
 
 if len(sys.argv) != 3:
@@ -15,53 +18,50 @@ if next_tag.startswith('v'):
 next_maple_version = sys.argv[2]
 
 
-def write_back(lines, f):
-    with open(f, 'w') as writer:
-        writer.writelines(lines)
+def patch_line(fname, idx, new_line):
+    """
+    Replace the line `idx` of `fname` with `new_line`, the file is streamed
+    line by line instead of being read into memory entirely.
+    """
+    with fileinput.input(fname, inplace=True) as f:
+        for lineno, line in enumerate(f):
+            sys.stdout.write(new_line if lineno == idx else line)
 
 
-def read_file(fname):
-    f = open(fname)
-    return f.readlines()
+def insert_release_header(fname, release_header):
+    """
+    Insert `release_header` right after the `[unreleased]` header.
+    """
+    path = pathlib.Path(fname)
+    content = re.sub(r'^## \[unreleased\]\n',
+                     lambda m: m.group(0) + '\n' + release_header + '\n',
+                     path.read_text(),
+                     count=1,
+                     flags=re.MULTILINE)
+    path.write_text(content)
 
 
 #  install.sh
-fname = '../install.sh'
-lines = read_file(fname)
-lines[4] = "version=v{version}\n".format(version=next_tag)
-write_back(lines, fname)
+patch_line('../install.sh', 4, "version=v{version}\n".format(version=next_tag))
 
 #  install.ps1
-fname = '../install.ps1'
-lines = read_file(fname)
-lines[2] = "$version = 'v{version}'\n".format(version=next_tag)
-write_back(lines, fname)
+patch_line('../install.ps1', 2,
+           "$version = 'v{version}'\n".format(version=next_tag))
 
 #  plugin/clap.vim
-fname = '../plugin/clap.vim'
-lines = read_file(fname)
-lines[3] = '" Version:   {version}\n'.format(version=next_tag)
-write_back(lines, fname)
+patch_line('../plugin/clap.vim', 3,
+           '" Version:   {version}\n'.format(version=next_tag))
 
 #  CHANGELOG.md
-fname = '../CHANGELOG.md'
-lines = read_file(fname)
 now = datetime.datetime.now()
 today = now.strftime("%Y-%m-%d")
 release_header = '## [{version}] {today}'.format(version=next_tag, today=today)
-lines.insert(4, "\n")
-lines.insert(5, release_header)
-lines.insert(6, "\n")
-write_back(lines, fname)
+insert_release_header('../CHANGELOG.md', release_header)
 
 #  Cargo.toml
-fname = '../Cargo.toml'
-lines = read_file(fname)
-lines[4] = 'version = "{version}"\n'.format(version=next_maple_version)
-write_back(lines, fname)
+patch_line('../Cargo.toml', 4,
+           'version = "{version}"\n'.format(version=next_maple_version))
 
 #  update_release_note.sh
-fname = 'update_release_note.sh'
-lines = read_file(fname)
-lines[4] = 'new_tag=v{version}\n'.format(version=next_tag)
-write_back(lines, fname)
+patch_line('update_release_note.sh', 4,
+           'new_tag=v{version}\n'.format(version=next_tag))